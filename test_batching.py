@@ -0,0 +1,127 @@
+import random
+from datetime import datetime, timedelta
+
+from simple_app import (
+    DURATION_RATIO, Batch, MachineType, Order, PaperType, PrintType, SimpleSmartBatching,
+    SimpleVisualizer, plan_key,
+)
+
+
+def make_order(order_id, print_type, paper_type, quantity, priority=0):
+    return Order(order_id, MachineType.ROLL, print_type, paper_type,
+                 1000, (210, 297), None, datetime.now() + timedelta(days=7),
+                 quantity, priority)
+
+
+def random_orders(n, seed=1):
+    rng = random.Random(seed)
+    return [
+        make_order(f"O{i}", rng.choice(list(PrintType)), rng.choice(list(PaperType)),
+                   rng.choice([1000, 2000, 3000, 5000, 9000, 15000]),
+                   rng.choice([0, 0, 0, 1, 2]))
+        for i in range(n)
+    ]
+
+
+def test_every_order_in_exactly_one_batch():
+    orders = random_orders(200)
+    result = SimpleSmartBatching().process(orders)
+
+    batched = [o.id for b in result['batches'] for o in b.orders]
+    assert sorted(batched) == sorted(o.id for o in orders)
+    assert result['total_orders'] == len(orders)
+    assert result['metrics']['total_batches'] == len(result['batches'])
+
+
+def test_batches_share_one_setup():
+    result = SimpleSmartBatching().process(random_orders(200))
+
+    for b in result['batches']:
+        assert {(o.print_type, o.paper_type) for o in b.orders} == {(b.print_type, b.paper_type)}
+
+
+def test_normal_batches_respect_duration_ratio():
+    result = SimpleSmartBatching().process(random_orders(200))
+
+    for b in result['batches']:
+        if b.avg_priority > 0:
+            continue
+        qty = [o.quantity for o in b.orders]
+        assert qty == sorted(qty, reverse=True)
+        assert max(qty) <= DURATION_RATIO * min(qty)
+
+
+def test_batch_totals_match_orders():
+    result = SimpleSmartBatching().process(random_orders(200))
+
+    for b in result['batches']:
+        assert b.total_quantity == sum(o.quantity for o in b.orders)
+        assert b.avg_priority == sum(o.priority for o in b.orders) / len(b.orders)
+
+        rebuilt = Batch(b.id, b.orders, b.print_type, b.paper_type)
+        assert (rebuilt.total_quantity, rebuilt.avg_priority, rebuilt.color) == \
+            (b.total_quantity, b.avg_priority, b.color)
+
+
+def test_precomputed_plan_gives_same_result():
+    orders = random_orders(200)
+    plan = SimpleSmartBatching.plan(plan_key(orders))
+
+    assert SimpleSmartBatching().process(orders, plan=plan) == SimpleSmartBatching().process(orders)
+
+
+def test_urgent_batches_come_first():
+    result = SimpleSmartBatching().process(random_orders(200))
+
+    urgent = [all(o.priority > 0 for o in b.orders) for b in result['batches']]
+    normal = [all(o.priority == 0 for o in b.orders) for b in result['batches']]
+    assert all(u or n for u, n in zip(urgent, normal))
+    assert urgent == sorted(urgent, reverse=True)
+    assert any(urgent) and any(normal)
+
+
+def test_changeover_metrics():
+    # FIFO: Ч/Б+Обычная -> Цветная+Мелованная (20) -> Ч/Б+Обычная (20)
+    #       -> Ч/Б+Мелованная (10): 3 переналадки, 50 мин.
+    # Smart: срочный D, затем B и A+C - 10 + 20 мин при любом порядке групп
+    orders = [
+        make_order('A', PrintType.BW, PaperType.PLAIN, 5000),
+        make_order('B', PrintType.COLOR, PaperType.COATED, 4000),
+        make_order('C', PrintType.BW, PaperType.PLAIN, 3000),
+        make_order('D', PrintType.BW, PaperType.COATED, 6000, priority=1),
+    ]
+    result = SimpleSmartBatching().process(orders)
+
+    assert [o.id for o in result['batches'][0].orders] == ['D']
+    assert sorted([o.id for o in b.orders] for b in result['batches']) == [['A', 'C'], ['B'], ['D']]
+    assert sorted(result['changeover_minutes']) == [0, 10, 20]
+    assert result['metrics'] == {
+        'total_batches': 3,
+        'total_changeovers': 2,
+        'total_changeover_time_minutes': 30,
+        'fifo_changeovers': 3,
+        'fifo_changeover_time_minutes': 50,
+    }
+
+
+def test_mixed_urgent_orders_pay_for_their_setups():
+    orders = [
+        make_order(f"U{i}", *((PrintType.BW, PaperType.PLAIN) if i % 2 == 0
+                              else (PrintType.COLOR, PaperType.COATED)), 5000, priority=1)
+        for i in range(4)
+    ]
+    result = SimpleSmartBatching().process(orders)
+
+    assert result['metrics']['total_batches'] == 2
+    assert result['metrics']['total_changeover_time_minutes'] == 20
+    assert result['metrics']['fifo_changeover_time_minutes'] == 60
+
+
+def test_comparison_without_fifo_changeovers():
+    orders = [make_order(f"O{i}", PrintType.BW, PaperType.PLAIN, 5000) for i in range(3)]
+    result = SimpleSmartBatching().process(orders)
+
+    data, saving = SimpleVisualizer().comparison_data(result)
+    assert data['FIFO'].tolist() == [0, 0]
+    assert data['Smart'].tolist() == [0, 0]
+    assert saving == 'Экономия: 0 мин (0%)'